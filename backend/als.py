@@ -0,0 +1,173 @@
+# als.py
+# Implicit-feedback matrix factorization (ALS, Hu/Koren/Volinsky 2008) over the patient×drug and
+# patient×condition CSR matrices.
+#
+# Conditions are side features: they are factorized as extra items next to the drugs, so drug and condition
+# factors live in the same latent space. A patient we have never seen (e.g. one created through the API with
+# only a condition string) is folded in from their condition factors alone, and serving is a single dot
+# product of that user vector against the drug factor matrix.
+#
+# Training is vectorized per block of rows (gather factors → weighted outer products → batched k×k solves)
+# and blocks are solved in parallel threads (NumPy / SciPy / LAPACK release the GIL for these kernels).
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from scipy.sparse import csr_matrix, hstack
+
+ALS_ARRAYS = ('als_drug_factors', 'als_condition_factors', 'als_gram', 'als_mean_user')
+MAX_BLOCK_NNZ = 8192    # caps the nnz × k × k outer-product buffer of one block
+MAX_BLOCK_ROWS = 2048
+
+
+def _row_blocks(indptr, max_block_nnz, max_block_rows):
+    """Split rows into [start, stop) blocks holding at most ~max_block_nnz non-zeros / max_block_rows rows."""
+    n_rows = len(indptr) - 1
+    blocks, start = [], 0
+    while start < n_rows:
+        stop = int(np.searchsorted(indptr, indptr[start] + max_block_nnz, side='right')) - 1
+        stop = min(max(stop, start + 1), start + max_block_rows, n_rows)
+        blocks.append((start, stop))
+        start = stop
+    return blocks
+
+
+def _solve_block(conf, factors, gram, start, stop, out, max_block_nnz=None):
+    """Least-squares step for rows [start, stop) of the confidence matrix (data = c - 1 = alpha * r)."""
+    sub = conf[start:stop]
+    k = factors.shape[1]
+    n_rows = stop - start
+    if n_rows == 1 and max_block_nnz is not None and sub.nnz > max_block_nnz:
+        out[start] = _solve_heavy_row(sub, factors, gram, max_block_nnz)
+        return
+    gathered = factors[sub.indices]                                  # nnz × k
+    # Segment-sum matrices: row u of the block sums over its own non-zeros
+    seg_w = csr_matrix((sub.data, np.arange(sub.nnz), sub.indptr), shape=(n_rows, sub.nnz))
+    seg_b = csr_matrix((sub.data + 1.0, np.arange(sub.nnz), sub.indptr), shape=(n_rows, sub.nnz))
+    outer = (gathered[:, :, None] * gathered[:, None, :]).reshape(sub.nnz, k * k)
+    A = (seg_w @ outer).reshape(n_rows, k, k) + gram                 # YtY + λI + Yuᵀ(Cu − I)Yu
+    b = seg_b @ gathered                                             # Yuᵀ Cu p(u)
+    out[start:stop] = np.linalg.solve(A, b[:, :, None])[:, :, 0]
+
+
+def _solve_heavy_row(row, factors, gram, chunk_nnz):
+    """Same step for one row with more than chunk_nnz non-zeros (e.g. a common drug in the item half-step):
+    Yuᵀ(Cu − I)Yu is accumulated as k×k products over chunks of its non-zeros, so memory stays chunk × k."""
+    A = np.array(gram, dtype=np.float64)
+    b = np.zeros(gram.shape[0], dtype=np.float64)
+    for lo in range(0, row.nnz, chunk_nnz):
+        hi = min(lo + chunk_nnz, row.nnz)
+        Yu = factors[row.indices[lo:hi]]
+        w = row.data[lo:hi]
+        A += Yu.T @ (w[:, None] * Yu)
+        b += (w + 1.0) @ Yu
+    return np.linalg.solve(A, b)
+
+
+class ImplicitALS:
+    def __init__(self, factors=32, regularization=0.1, alpha=20.0, condition_weight=0.5, iterations=10,
+                 max_block_nnz=MAX_BLOCK_NNZ, max_block_rows=MAX_BLOCK_ROWS, n_threads=None, random_state=42):
+        self.factors = factors
+        self.regularization = regularization
+        self.alpha = alpha
+        self.condition_weight = condition_weight
+        self.iterations = iterations
+        self.max_block_nnz = max_block_nnz
+        self.max_block_rows = max_block_rows
+        self.n_threads = n_threads or os.cpu_count() or 1
+        self.random_state = random_state
+
+    def _half_step(self, pool, conf, fixed, out):
+        gram = fixed.T @ fixed + self.regularization * np.eye(self.factors, dtype=fixed.dtype)
+        blocks = _row_blocks(conf.indptr, self.max_block_nnz, self.max_block_rows)
+        list(pool.map(lambda blk: _solve_block(conf, fixed, gram, blk[0], blk[1], out, self.max_block_nnz), blocks))
+
+    def fit(self, drug_matrix, condition_matrix):
+        started = time.perf_counter()
+        n_drugs = drug_matrix.shape[1]
+        items = hstack([
+            csr_matrix(drug_matrix, dtype=np.float32),
+            csr_matrix(condition_matrix, dtype=np.float32) * self.condition_weight,
+        ], format='csr')
+        items.sum_duplicates()
+        conf_users = items.copy()
+        conf_users.data *= self.alpha
+        conf_items = conf_users.T.tocsr()
+
+        rng = np.random.default_rng(self.random_state)
+        users = np.zeros((items.shape[0], self.factors), dtype=np.float32)
+        item_factors = (rng.standard_normal((items.shape[1], self.factors)) * 0.01).astype(np.float32)
+        with ThreadPoolExecutor(max_workers=self.n_threads) as pool:
+            for _ in range(self.iterations):
+                self._half_step(pool, conf_users, item_factors, users)
+                self._half_step(pool, conf_items, users, item_factors)
+
+        self.user_factors = users
+        self.drug_factors = item_factors[:n_drugs]
+        self.condition_factors = item_factors[n_drugs:]
+        self.gram = item_factors.T @ item_factors + self.regularization * np.eye(self.factors, dtype=np.float32)
+        self.mean_user = users.mean(axis=0) if len(users) else np.zeros(self.factors, dtype=np.float32)
+        self.train_seconds = time.perf_counter() - started
+        return self
+
+    def to_arrays(self):
+        return {
+            'als_drug_factors': self.drug_factors,
+            'als_condition_factors': self.condition_factors,
+            'als_gram': self.gram,
+            'als_mean_user': self.mean_user,
+        }
+
+    def params(self):
+        return {
+            'factors': self.factors, 'regularization': self.regularization, 'alpha': self.alpha,
+            'condition_weight': self.condition_weight, 'iterations': self.iterations,
+        }
+
+
+class ALSModel:
+    """Serving side: fold a patient in from their conditions and score all drugs with one dot product."""
+
+    def __init__(self, drug_factors, condition_factors, gram, mean_user, alpha, condition_weight):
+        self.drug_factors = drug_factors
+        self.condition_factors = condition_factors
+        self.gram = gram
+        self.mean_user = mean_user
+        self.alpha = alpha
+        self.condition_weight = condition_weight
+
+    @classmethod
+    def from_artifacts(cls, artifacts):
+        if artifacts is None or any(name not in artifacts.arrays for name in ALS_ARRAYS):
+            return None
+        params = artifacts.metadata.get('als', {})
+        return cls(*(artifacts.arrays[name] for name in ALS_ARRAYS),
+                   alpha=params.get('alpha', 20.0), condition_weight=params.get('condition_weight', 0.5))
+
+    def user_vectors(self, condition_rows):
+        """Fold-in for a batch of patients: condition_rows is a (patients × conditions) sparse count matrix."""
+        conf = csr_matrix(condition_rows, dtype=np.float32) * (self.alpha * self.condition_weight)
+        out = np.empty((conf.shape[0], self.gram.shape[0]), dtype=np.float32)
+        empty = np.diff(conf.indptr) == 0
+        factors, gram = np.asarray(self.condition_factors), np.asarray(self.gram)
+        for start, stop in _row_blocks(conf.indptr, MAX_BLOCK_NNZ, MAX_BLOCK_ROWS):
+            _solve_block(conf, factors, gram, start, stop, out, MAX_BLOCK_NNZ)
+        out[empty] = self.mean_user  # nothing to fold in from → population-average patient
+        return out
+
+    def user_vector(self, condition_cols):
+        cols = np.asarray(condition_cols, dtype=np.int64)
+        row = csr_matrix((np.ones(len(cols), dtype=np.float32), cols, [0, len(cols)]),
+                         shape=(1, self.condition_factors.shape[0]))
+        return self.user_vectors(row)[0]
+
+    def scores(self, user_vectors):
+        return user_vectors @ np.asarray(self.drug_factors).T
+
+    def recommend(self, condition_cols, top_n=5):
+        scores = self.scores(self.user_vector(condition_cols))
+        top_n = min(top_n, len(scores))
+        top = np.argpartition(-scores, top_n - 1)[:top_n] if top_n else np.array([], dtype=np.int64)
+        top = top[np.argsort(-scores[top])]
+        return top, scores[top]
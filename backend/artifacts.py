@@ -0,0 +1,176 @@
+# artifacts.py
+# Versioned, uncompressed model artifacts (raw .npy CSR components + id maps) opened with mmap_mode='r',
+# so every API worker shares one page-cache copy of the interaction matrices instead of decompressing its own.
+#
+# Layout:
+#   <ARTIFACT_ROOT>/CURRENT                      name of the active version (swapped atomically)
+#   <ARTIFACT_ROOT>/<version>/manifest.json      format, version, shapes/dtypes, free-form metadata
+#   <ARTIFACT_ROOT>/<version>/<matrix>.data.npy  CSR data / indices / indptr per matrix
+#   <ARTIFACT_ROOT>/<version>/<array>.npy        id maps and any extra arrays (e.g. person_ids, drug_ids)
+
+import os
+import json
+import shutil
+from datetime import datetime, timezone
+import numpy as np
+
+ARTIFACT_ROOT = os.getenv('ARTIFACT_ROOT', os.path.join(os.path.dirname(os.path.realpath(__file__)), 'data', 'Ingested_data', 'artifacts'))
+ARTIFACT_FORMAT = 1
+CURRENT_FILE = 'CURRENT'
+CSR_PARTS = ('data', 'indices', 'indptr')
+
+
+def new_version():
+    return datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%fZ')
+
+
+def save_artifacts(root, matrices, arrays, metadata=None, publish=True, version=None):
+    """Write CSR matrices and plain arrays into <root>/<version>/ and (optionally) make it CURRENT."""
+    from scipy.sparse import csr_matrix
+    version = version or new_version()
+    final_dir = os.path.join(root, version)
+    tmp_dir = final_dir + '.tmp'
+    os.makedirs(tmp_dir, exist_ok=True)
+
+    manifest = {
+        "format": ARTIFACT_FORMAT,
+        "version": version,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "matrices": {},
+        "arrays": {},
+        "metadata": metadata or {},
+    }
+    for name, mat in matrices.items():
+        mat = csr_matrix(mat)
+        if not mat.has_canonical_format:
+            mat = mat.copy()  # the source may be a read-only memory map
+            mat.sum_duplicates()
+        for part in CSR_PARTS:
+            np.save(os.path.join(tmp_dir, f'{name}.{part}.npy'), getattr(mat, part))
+        manifest["matrices"][name] = {"shape": [int(s) for s in mat.shape], "nnz": int(mat.nnz), "dtype": str(mat.dtype)}
+    for name, arr in arrays.items():
+        arr = np.ascontiguousarray(arr)
+        np.save(os.path.join(tmp_dir, f'{name}.npy'), arr)
+        manifest["arrays"][name] = {"shape": [int(s) for s in arr.shape], "dtype": str(arr.dtype)}
+    with open(os.path.join(tmp_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    # A version directory only ever appears complete
+    os.replace(tmp_dir, final_dir)
+    if publish:
+        set_current_version(root, version)
+    return version
+
+
+def set_current_version(root, version):
+    tmp = os.path.join(root, CURRENT_FILE + '.tmp')
+    with open(tmp, 'w') as f:
+        f.write(version)
+    os.replace(tmp, os.path.join(root, CURRENT_FILE))
+
+
+def current_version(root=ARTIFACT_ROOT):
+    try:
+        with open(os.path.join(root, CURRENT_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def list_versions(root=ARTIFACT_ROOT):
+    if not os.path.isdir(root):
+        return []
+    return sorted(v for v in os.listdir(root) if os.path.exists(os.path.join(root, v, 'manifest.json')))
+
+
+def prune_versions(root=ARTIFACT_ROOT, keep=3):
+    """Delete all but the newest `keep` versions (never the CURRENT one)."""
+    current = current_version(root)
+    for version in list_versions(root)[:-keep]:
+        if version != current:
+            shutil.rmtree(os.path.join(root, version), ignore_errors=True)
+
+
+class ModelArtifacts:
+    """Read-only view of one artifact version; matrices are CSR wrappers over memory-mapped arrays."""
+
+    def __init__(self, path, mmap_mode='r'):
+        # scipy is imported here rather than at module level so `import main` stays light; the API loads
+        # artifacts from its lifespan hook
+        from scipy.sparse import csr_matrix
+        self.path = path
+        with open(os.path.join(path, 'manifest.json')) as f:
+            self.manifest = json.load(f)
+        if self.manifest.get("format") != ARTIFACT_FORMAT:
+            raise ValueError(f"Unsupported artifact format in {path}: {self.manifest.get('format')}")
+        self.version = self.manifest["version"]
+        self.metadata = self.manifest.get("metadata", {})
+
+        load = lambda name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mmap_mode)
+        self.matrices = {}
+        for name, info in self.manifest["matrices"].items():
+            parts = tuple(load(f'{name}.{part}') for part in CSR_PARTS)
+            self.matrices[name] = csr_matrix(parts, shape=tuple(info["shape"]), copy=False)
+        self.arrays = {name: load(name) for name in self.manifest["arrays"]}
+        self._derived = {}
+
+    def derived(self, name, factory):
+        """Per-version cache for objects built from these artifacts (e.g. indexes); dropped with the version."""
+        if name not in self._derived:
+            self._derived[name] = factory(self)
+        return self._derived[name]
+
+    # Interaction matrices and id maps written by scripts/build_interaction_matrix.py
+    @property
+    def drug_matrix(self):
+        return self.matrices['drug']
+
+    @property
+    def condition_matrix(self):
+        return self.matrices['condition']
+
+    @property
+    def person_ids(self):
+        return self.arrays['person_ids']
+
+    @property
+    def drug_ids(self):
+        return self.arrays['drug_ids']
+
+    @property
+    def condition_ids(self):
+        return self.arrays['condition_ids']
+
+    @staticmethod
+    def _positions(sorted_ids, ids):
+        # id maps are sorted, so id -> row/column is a binary search; -1 when absent
+        ids = np.atleast_1d(np.asarray(ids, dtype=np.int64))
+        if len(sorted_ids) == 0:
+            return np.full(len(ids), -1, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(sorted_ids, ids), len(sorted_ids) - 1)
+        return np.where(sorted_ids[pos] == ids, pos, -1)
+
+    def person_rows(self, person_ids):
+        return self._positions(self.person_ids, person_ids)
+
+    def drug_cols(self, drug_ids):
+        return self._positions(self.drug_ids, drug_ids)
+
+    def condition_cols(self, condition_ids):
+        return self._positions(self.condition_ids, condition_ids)
+
+    def nbytes(self):
+        total = sum(sum(getattr(m, part).nbytes for part in CSR_PARTS) for m in self.matrices.values())
+        return total + sum(a.nbytes for a in self.arrays.values())
+
+
+def load_artifacts(path, mmap_mode='r'):
+    return ModelArtifacts(path, mmap_mode=mmap_mode)
+
+
+def load_current(root=ARTIFACT_ROOT, mmap_mode='r'):
+    """Open the CURRENT version under root, or None when nothing has been published yet."""
+    version = current_version(root)
+    if version is None:
+        return None
+    return ModelArtifacts(os.path.join(root, version), mmap_mode=mmap_mode)
@@ -0,0 +1,167 @@
+# batch_scoring.py
+# Vectorized, matrix-based versions of get_patient_recommendations and get_co_usage_drugs, used by
+# scripts/batch_score.py to materialize results for every Patient ahead of time.
+#
+# Same semantics as the live SQL path:
+#   - a patient's condition string matches every condition whose name contains it (case-insensitive)
+#     and that has at least one recorded occurrence
+#   - cohort = all persons with any matched condition; drugs ranked by summed exposures of the cohort
+#   - co-usage anchors on the top recommended drug: drugs ranked by summed exposures of its co-users,
+#     each labelled with the most frequent condition among persons taking both drugs
+# but computed once per distinct condition string, in blocks of sparse matrix products.
+
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from scipy.sparse import csr_matrix
+from artifacts import load_artifacts, save_artifacts
+
+_worker_matrices = None
+
+
+def condition_match_matrix(condition_strings, condition_names):
+    """(strings × condition columns) 0/1 matrix; condition_names[col] is None for unnamed conditions."""
+    rows, cols = [], []
+    lowered = [(col, name.lower()) for col, name in enumerate(condition_names) if name]
+    for r, text in enumerate(condition_strings):
+        needle = text.strip().lower()
+        if not needle:
+            continue
+        for col, name in lowered:
+            if needle in name:
+                rows.append(r)
+                cols.append(col)
+    data = np.ones(len(rows), dtype=np.float32)
+    return csr_matrix((data, (rows, cols)), shape=(len(condition_strings), len(condition_names)))
+
+
+def _binary(mat):
+    out = csr_matrix(mat, dtype=np.float32, copy=True)
+    out.data[:] = 1
+    return out
+
+
+def _top_n(dense_row, top_n, exclude=None):
+    row = np.asarray(dense_row, dtype=np.float64).copy()
+    if exclude is not None:
+        row[exclude] = 0
+    candidates = np.flatnonzero(row > 0)
+    if len(candidates) > top_n:
+        candidates = candidates[np.argpartition(-row[candidates], top_n - 1)[:top_n]]
+    return candidates[np.argsort(-row[candidates], kind='stable')], row
+
+
+class ScoringMatrices:
+    """Float copies of the interaction matrices (int8 counts would overflow when summed), a column-major copy
+    of the drug matrix for co-user lookups, and the binary condition matrix."""
+
+    def __init__(self, drugs, drugs_csc, conditions):
+        self.drugs = drugs
+        self.drugs_csc = drugs_csc
+        self.conditions = conditions
+
+    @classmethod
+    def build(cls, artifacts):
+        drugs = csr_matrix(artifacts.drug_matrix, dtype=np.float32)
+        return cls(drugs, drugs.tocsc(), _binary(artifacts.condition_matrix))
+
+    def save(self, root):
+        """Write once as an unpublished artifact version; returns its path for the workers to memory-map."""
+        # drugs_csc is stored as the CSR of the transpose — the same three arrays
+        version = save_artifacts(root, {'drugs': self.drugs, 'drugs_t': self.drugs_csc.T, 'conditions': self.conditions},
+                                 {}, publish=False, version='scoring')
+        return os.path.join(root, version)
+
+    @classmethod
+    def load(cls, path):
+        mats = load_artifacts(path).matrices
+        return cls(mats['drugs'], mats['drugs_t'].T, mats['conditions'])
+
+
+def score_block(mats, match, top_n=5):
+    """Top-N (drug column, exposures) per condition string for one block of the match matrix."""
+    cohort = _binary(match @ mats.conditions.T)       # strings × persons
+    exposures = (cohort @ mats.drugs).toarray()       # strings × drugs
+    results = []
+    for r in range(match.shape[0]):
+        cols, row = _top_n(exposures[r], top_n)
+        results.append([(int(c), int(row[c])) for c in cols])
+    return results
+
+
+def co_usage_for_anchor(mats, anchor_col, condition_name_codes, top_n=2):
+    """Co-used drug columns for one anchor drug → [(drug col, exposures, condition name code or -1)]."""
+    co_users = mats.drugs_csc[:, anchor_col].indices   # persons who took the anchor drug
+    if len(co_users) == 0:
+        return []
+    sub = mats.drugs[co_users]
+    totals = np.asarray(sub.sum(axis=0)).ravel()
+    cols, totals = _top_n(totals, top_n, exclude=anchor_col)
+
+    cond_binary = mats.conditions[co_users]
+    sub_csc = sub.tocsc()
+    named = condition_name_codes >= 0
+    out = []
+    for c in cols:
+        both = sub_csc[:, c].indices                   # co-users who also took drug c
+        per_condition = np.asarray(cond_binary[both].sum(axis=0)).ravel()
+        by_name = np.bincount(condition_name_codes[named], weights=per_condition[named],
+                              minlength=int(condition_name_codes.max()) + 1 if named.any() else 0)
+        code = int(np.argmax(by_name)) if len(by_name) and by_name.max() > 0 else -1
+        out.append((int(c), int(totals[c]), code))
+    return out
+
+
+def _init_worker(matrices_path):
+    # Workers memory-map the matrices the parent wrote once, so they share one page-cache copy and are never
+    # pickled; memory no longer grows with the number of workers
+    global _worker_matrices
+    _worker_matrices = ScoringMatrices.load(matrices_path)
+
+
+def _score_block_worker(args):
+    match, top_n = args
+    return score_block(_worker_matrices, match, top_n)
+
+
+def _co_usage_worker(args):
+    anchor_col, condition_name_codes, top_n = args
+    return anchor_col, co_usage_for_anchor(_worker_matrices, anchor_col, condition_name_codes, top_n)
+
+
+def score_all(artifacts, condition_strings, condition_names, top_n=5, co_usage_top_n=2,
+              block_size=256, workers=None):
+    """Score distinct condition strings in parallel blocks → (recommendations, co_usage) keyed by string.
+
+    recommendations[s] = [(drug col, exposures)], co_usage[s] = [(drug col, exposures, condition name or None)]
+    """
+    workers = workers or os.cpu_count() or 1
+    distinct = sorted({s.strip() for s in condition_strings if s and s.strip()})
+    match = condition_match_matrix(distinct, condition_names)
+    blocks = [(match[i:i + block_size], top_n) for i in range(0, len(distinct), block_size)]
+
+    # Name codes let co-usage group conditions by name, like the live GROUP BY Condition.concept_name
+    name_lookup = {}
+    condition_name_codes = np.array([name_lookup.setdefault(n, len(name_lookup)) if n else -1
+                                     for n in condition_names], dtype=np.int64)
+
+    # On disk next to the artifact versions rather than in /tmp, which may be RAM-backed
+    scratch = tempfile.mkdtemp(prefix='.batch_scoring_', dir=os.path.dirname(artifacts.path))
+    try:
+        matrices_path = ScoringMatrices.build(artifacts).save(scratch)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(matrices_path,)) as pool:
+            scored = [rec for block in pool.map(_score_block_worker, blocks) for rec in block]
+            recommendations = dict(zip(distinct, scored))
+            anchors = sorted({recs[0][0] for recs in scored if recs})
+            co_usage_by_anchor = dict(pool.map(_co_usage_worker, [(a, condition_name_codes, co_usage_top_n) for a in anchors]))
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    names_by_code = {code: name for name, code in name_lookup.items()}
+    co_usage = {
+        s: [(c, n, names_by_code.get(code)) for c, n, code in co_usage_by_anchor[recs[0][0]]] if recs else []
+        for s, recs in recommendations.items()
+    }
+    return recommendations, co_usage
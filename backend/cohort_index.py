@@ -0,0 +1,134 @@
+# cohort_index.py
+# Precomputed compressed bitsets for demographic cohort selection, aligned to the CSR row order of the artifacts.
+#
+# One set per gender, per age band and per condition is built at artifact time; "female, 45–59, with asthma"
+# is then a membership test of the condition's rows against the gender and age sets instead of a multi-join
+# SQL query.
+#
+# Each set is stored in whichever of two containers is smaller (the Roaring rule, applied per set):
+#   - array:  sorted int32 row ids, 4 bytes per member — almost every condition
+#   - bitmap: np.packbits, n_persons / 8 bytes — only sets holding more than 1/32 of the patients (gender,
+#             age bands, a few very common conditions)
+# so storage is bounded by min(4 · |set|, n_persons / 8) per set, i.e. linear in the condition matrix's
+# non-zeros rather than n_conditions × n_persons / 8. Cohorts are handled as sorted row-id arrays.
+
+import numpy as np
+
+# OMOP gender concepts and the strings the Patient form stores
+GENDER_CONCEPTS = {'male': 8507, 'm': 8507, 'female': 8532, 'f': 8532}
+AGE_BANDS = ((0, 17), (18, 29), (30, 44), (45, 59), (60, 74), (75, 200))
+BITMAP_ARRAY = 'cohort_bitmaps'
+ROW_IDS_ARRAY = 'cohort_row_ids'
+ROW_OFFSETS_ARRAY = 'cohort_row_offsets'
+
+
+def age_band(age):
+    if age is None:
+        return None
+    for low, high in AGE_BANDS:
+        if low <= age <= high:
+            return f'{low}-{high}'
+    return None
+
+
+def gender_concept(gender):
+    return GENDER_CONCEPTS.get((gender or '').strip().lower())
+
+
+def build_cohort_index(gender_concept_ids, years_of_birth, condition_matrix, reference_year):
+    """Return (arrays, metadata) for the artifact; metadata maps keys like 'gender:8532', 'age:45-59',
+    'condition:<column>' to their container: ['bitmap', i] or ['array', j]."""
+    gender_concept_ids = np.asarray(gender_concept_ids)
+    years_of_birth = np.asarray(years_of_birth)
+    ages = np.where(years_of_birth > 0, reference_year - years_of_birth, -1)  # unknown birth year → no band
+    n_rows = condition_matrix.shape[0]
+    n_bytes = (n_rows + 7) // 8
+
+    sets = []
+    for concept in sorted(set(GENDER_CONCEPTS.values())):
+        sets.append((f'gender:{concept}', np.flatnonzero(gender_concept_ids == concept)))
+    for low, high in AGE_BANDS:
+        sets.append((f'age:{low}-{high}', np.flatnonzero((ages >= low) & (ages <= high))))
+    csc = condition_matrix.tocsc()
+    csc.sort_indices()
+    for col in range(csc.shape[1]):
+        sets.append((f'condition:{col}', csc.indices[csc.indptr[col]:csc.indptr[col + 1]]))
+
+    keys, bitmaps, row_ids, offsets = {}, [], [], [0]
+    for key, rows in sets:
+        if 4 * len(rows) > n_bytes:
+            mask = np.zeros(n_rows, dtype=bool)
+            mask[rows] = True
+            keys[key] = ['bitmap', len(bitmaps)]
+            bitmaps.append(np.packbits(mask))
+        else:
+            keys[key] = ['array', len(offsets) - 1]
+            row_ids.append(np.asarray(rows, dtype=np.int32))
+            offsets.append(offsets[-1] + len(rows))
+
+    arrays = {
+        BITMAP_ARRAY: np.vstack(bitmaps) if bitmaps else np.zeros((0, n_bytes), dtype=np.uint8),
+        ROW_IDS_ARRAY: np.concatenate(row_ids) if row_ids else np.zeros(0, dtype=np.int32),
+        ROW_OFFSETS_ARRAY: np.asarray(offsets, dtype=np.int64),
+    }
+    return arrays, {'keys': keys, 'reference_year': reference_year}
+
+
+class CohortIndex:
+    def __init__(self, keys, bitmaps, row_ids, row_offsets, n_rows, reference_year):
+        self.keys = keys
+        self.bitmaps = bitmaps
+        self.row_ids = row_ids
+        self.row_offsets = row_offsets
+        self.n_rows = n_rows
+        self.reference_year = reference_year
+
+    @classmethod
+    def from_artifacts(cls, artifacts):
+        info = artifacts.metadata.get('cohort_index') if artifacts is not None else None
+        if info is None or ROW_IDS_ARRAY not in artifacts.arrays:
+            return None
+        arrays = artifacts.arrays
+        return cls(info['keys'], arrays[BITMAP_ARRAY], arrays[ROW_IDS_ARRAY], arrays[ROW_OFFSETS_ARRAY],
+                   artifacts.condition_matrix.shape[0], info.get('reference_year'))
+
+    def members(self, key):
+        """Sorted row ids of one stored set (empty for unknown keys)."""
+        container = self.keys.get(key)
+        if container is None:
+            return np.zeros(0, dtype=np.int64)
+        kind, i = container
+        if kind == 'bitmap':
+            return np.flatnonzero(np.unpackbits(self.bitmaps[i], count=self.n_rows))
+        return np.asarray(self.row_ids[self.row_offsets[i]:self.row_offsets[i + 1]], dtype=np.int64)
+
+    def contains(self, key, rows):
+        """Membership of sorted rows in one stored set — a bit test or a binary search, O(len(rows))."""
+        container = self.keys.get(key)
+        if container is None or len(rows) == 0:
+            return np.zeros(len(rows), dtype=bool)
+        kind, i = container
+        if kind == 'bitmap':
+            bitmap = self.bitmaps[i]
+            return (bitmap[rows >> 3] >> (7 - (rows & 7))) & 1 == 1
+        members = self.row_ids[self.row_offsets[i]:self.row_offsets[i + 1]]
+        if len(members) == 0:
+            return np.zeros(len(rows), dtype=bool)
+        pos = np.minimum(np.searchsorted(members, rows), len(members) - 1)
+        return members[pos] == rows
+
+    def conditions(self, cols):
+        """Rows with any of the given condition columns (union of their sets)."""
+        parts = [self.members(f'condition:{int(col)}') for col in cols]
+        return np.unique(np.concatenate(parts)) if parts else np.zeros(0, dtype=np.int64)
+
+    def select(self, condition_cols, gender=None, age=None):
+        """Condition rows narrowed by the requested filters; None means 'do not filter on this'.
+        Unknown values match nobody."""
+        rows = self.conditions(condition_cols)
+        if gender is not None:
+            rows = rows[self.contains(f'gender:{gender}', rows)]
+        if age is not None:
+            band = age_band(age)
+            rows = rows[self.contains(f'age:{band}', rows)] if band else rows[:0]
+        return rows
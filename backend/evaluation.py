@@ -0,0 +1,312 @@
+# evaluation.py
+# Offline evaluation of the recommender strategies on the stored CSR artifacts, so speed-ups can be checked
+# against result quality.
+#
+# Leave-one-out: for every test patient one drug exposure is hidden from the training matrix. Each strategy
+# scores all test patients in batched matrix operations (blocks of rows, no per-patient SQL), drugs already
+# in the training row are masked, and the hidden drug's rank gives precision@k, recall@k and NDCG@k.
+# A score of -inf means "not scored": such drugs are never counted as recommended, so a patient the API would
+# answer with [] (e.g. no conditions → empty cohort) contributes no hits and no coverage.
+# Coverage is the share of all drugs that appear in any top-k list; throughput is patients scored per second.
+
+import time
+import numpy as np
+from scipy.sparse import csr_matrix, coo_matrix
+
+from als import ImplicitALS, ALSModel
+from cohort_index import age_band
+from similarity_index import build_minhash_index, profile_tokens, MinHashLSH
+
+K = 5
+BLOCK_SIZE = 1024
+
+
+class Split:
+    def __init__(self, train, conditions, test_rows, held_out):
+        self.train = train              # patients × drugs, float32, held-out exposures removed
+        self.conditions = conditions    # patients × conditions, float32 (not split)
+        self.test_rows = test_rows
+        self.held_out = held_out        # held-out drug column per test row
+
+
+def _binary(mat):
+    out = csr_matrix(mat, dtype=np.float32, copy=True)
+    out.data[:] = 1
+    return out
+
+
+def leave_one_out(drug_matrix, condition_matrix, rng, min_items=2, max_test=None):
+    """Hide one random exposure for each patient with at least min_items drugs (optionally a sample of them)."""
+    mat = csr_matrix(drug_matrix, dtype=np.float32, copy=True)
+    counts = np.diff(mat.indptr)
+    test_rows = np.flatnonzero(counts >= min_items)
+    if max_test is not None and len(test_rows) > max_test:
+        test_rows = np.sort(rng.choice(test_rows, size=max_test, replace=False))
+    picks = mat.indptr[test_rows] + (rng.random(len(test_rows)) * counts[test_rows]).astype(np.int64)
+    held_out = mat.indices[picks].copy()
+    mat.data[picks] = 0
+    mat.eliminate_zeros()
+    return Split(mat, csr_matrix(condition_matrix, dtype=np.float32), test_rows, held_out)
+
+
+def top_k(scores, seen, k=K):
+    """Top-k columns per row of a dense score block, never recommending already-seen items.
+    Slots left without a scored item (score -inf) are -1."""
+    scores = np.array(scores, dtype=np.float64)
+    rows, cols = seen.nonzero()
+    scores[rows, cols] = -np.inf
+    k = min(k, scores.shape[1])
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1, kind='stable')
+    top = np.take_along_axis(top, order, axis=1)
+    top[np.take_along_axis(top_scores, order, axis=1) == -np.inf] = -1
+    return top
+
+
+def unscored_zeros(scores):
+    """Count-based strategies: a drug with no exposures in the cohort was not recommended at all."""
+    scores = np.asarray(scores, dtype=np.float64)
+    return np.where(scores == 0, -np.inf, scores)
+
+
+def ranking_metrics(top, held_out, n_items, k=K):
+    """precision@k, recall@k and NDCG@k for one held-out item per row, plus catalogue coverage (-1 = empty slot)."""
+    match = (top == held_out[:, None]) & (top >= 0)
+    hit = match.any(axis=1)
+    rank = match.argmax(axis=1)
+    ndcg = np.where(hit, 1.0 / np.log2(rank + 2), 0.0)  # ideal DCG is 1 with a single relevant item
+    return {
+        f"precision@{k}": float(hit.mean() / k),
+        f"recall@{k}": float(hit.mean()),
+        f"ndcg@{k}": float(ndcg.mean()),
+        "coverage": float(len(np.unique(top[top >= 0])) / n_items),
+    }
+
+
+# ---------------------------- STRATEGIES ----------------------------
+# Each strategy: fit(split) once, then score(rows) → dense (len(rows) × drugs) scores for a block of rows,
+# -inf for drugs it did not score.
+# Strategies named after an API strategy score the way the API serves it; variants that need the patient's own
+# history (e.g. trained ALS factors) are extra entries with their own names.
+
+class Popularity:
+    name = "popularity"
+
+    def fit(self, split):
+        self.totals = np.asarray(split.train.sum(axis=0)).ravel()
+
+    def score(self, rows):
+        return unscored_zeros(np.tile(self.totals, (len(rows), 1)))
+
+
+class ConditionCohort:
+    """get_patient_recommendations: cohort = patients sharing a condition, ranked by summed exposures."""
+    name = "frequency"
+
+    def fit(self, split):
+        self.train = split.train
+        self.conditions = _binary(split.conditions)
+
+    def cohort(self, rows):
+        return _binary(self.conditions[rows] @ self.conditions.T)
+
+    def score(self, rows):
+        return unscored_zeros((self.cohort(rows) @ self.train).toarray())
+
+
+class DemographicCohort(ConditionCohort):
+    """get_demographic_recommendations: condition cohort restricted to the same gender and age band."""
+    name = "demographic"
+
+    def __init__(self, gender_concept_ids, years_of_birth, reference_year):
+        bands = [age_band(reference_year - y) if y > 0 else None for y in years_of_birth]
+        band_codes = {b: i for i, b in enumerate(sorted({b for b in bands if b}))}
+        band_idx = np.array([band_codes.get(b, -1) for b in bands], dtype=np.int64)
+        self.group = np.asarray(gender_concept_ids, dtype=np.int64) * 100 + band_idx
+
+    def cohort(self, rows):
+        shared = coo_matrix(super().cohort(rows))
+        same = self.group[np.asarray(rows)[shared.row]] == self.group[shared.col]
+        return csr_matrix((shared.data[same], (shared.row[same], shared.col[same])), shape=shared.shape)
+
+
+class CoUsage:
+    """get_co_usage_drugs: exposures of co-users of the patient's top frequency recommendation."""
+    name = "co_usage"
+
+    def fit(self, split):
+        self.frequency = ConditionCohort()
+        self.frequency.fit(split)
+        self.train = split.train
+        self.train_binary_csc = _binary(split.train).tocsc()
+
+    def score(self, rows):
+        anchors = top_k(self.frequency.score(rows), self.train[rows], k=1)[:, 0]
+        scores = np.full((len(rows), self.train.shape[1]), -np.inf)
+        anchored = anchors >= 0                         # no frequency recommendation → no co-usage either
+        unique, inverse = np.unique(anchors[anchored], return_inverse=True)
+        co_usage = (self.train_binary_csc[:, unique].T @ self.train).toarray()
+        scores[anchored] = unscored_zeros(co_usage[inverse])
+        return scores
+
+
+class ItemSimilarity:
+    """get_related_drugs: 0.7 · cosine + 0.3 · Pearson drug–drug similarity, summed over the patient's drugs."""
+    name = "item_similarity"
+
+    def fit(self, split):
+        from sklearn.metrics.pairwise import cosine_similarity
+        items = split.train.T.toarray()
+        items -= items.mean(axis=0, keepdims=True)  # StandardScaler(with_std=False) over patient columns
+        with np.errstate(invalid='ignore', divide='ignore'):
+            pearson = np.nan_to_num(np.corrcoef(items))
+        self.similarity = 0.7 * cosine_similarity(items) + 0.3 * pearson
+        np.fill_diagonal(self.similarity, 0)
+        self.train = split.train
+
+    def score(self, rows):
+        history = _binary(self.train[rows])
+        scores = np.asarray(history @ self.similarity, dtype=np.float64)
+        scores[np.diff(history.indptr) == 0] = -np.inf  # no drugs to be similar to
+        return scores
+
+
+class ALS:
+    """get_als_recommendations: patients folded in from their conditions alone (ALSModel.user_vectors)."""
+    name = "als"
+
+    def __init__(self, **params):
+        self.params = params
+        self.model = None
+        self._split = None
+        self.reused = False
+
+    def fit(self, split):
+        # Trained once per split, so ALSWarm and NearestNeighbours' fallback share the same factors
+        self.reused = self._split is split
+        if self.reused:
+            return
+        self.model = ImplicitALS(**self.params).fit(split.train, split.conditions)
+        self.serving = ALSModel(self.model.drug_factors, self.model.condition_factors, self.model.gram,
+                                self.model.mean_user, self.model.alpha, self.model.condition_weight)
+        self.conditions = split.conditions
+        self._split = split
+
+    def shared_fit(self):
+        """(strategy name, training seconds) when the last fit reused factors trained for another strategy."""
+        return (self.name, self.model.train_seconds) if self.reused else None
+
+    def score(self, rows):
+        return self.serving.scores(self.serving.user_vectors(self.conditions[rows]))
+
+
+class ALSWarm:
+    """ALS with the trained patient factors — patients seen in training, not what the API serves."""
+    name = "als_warm"
+
+    def __init__(self, als):
+        self.als = als
+
+    def fit(self, split):
+        self.als.fit(split)
+
+    def shared_fit(self):
+        return self.als.shared_fit()
+
+    def score(self, rows):
+        return self.als.model.user_factors[rows] @ self.als.model.drug_factors.T
+
+
+class NearestNeighbours:
+    """get_lsh_recommendations: top-k Jaccard neighbours (MinHash-LSH) on condition sets, with the same fallback
+    for patients without neighbours. profile=True queries condition ∪ drug sets instead (not served)."""
+
+    def __init__(self, k_neighbours=50, index=None, fallback=None, profile=False):
+        self.k_neighbours = k_neighbours
+        self.index = index          # the artifact's lsh_conditions index (conditions are not split)
+        self.fallback = fallback or ConditionCohort()
+        self.profile = profile
+        self.name = "lsh_profile" if profile else "lsh"
+
+    def fit(self, split):
+        if self.profile:
+            # Built on the training split so held-out exposures cannot leak into the signatures
+            tokens = profile_tokens(_binary(split.conditions), _binary(split.train))
+            arrays, meta = build_minhash_index(tokens, 'eval')
+            self.index = MinHashLSH.from_arrays(arrays, 'eval', meta, token_matrix=tokens)
+        elif self.index is None:
+            tokens = _binary(split.conditions)
+            arrays, meta = build_minhash_index(tokens, 'eval')
+            self.index = MinHashLSH.from_arrays(arrays, 'eval', meta, token_matrix=tokens)
+        self.tokens = self.index.token_matrix
+        self.fallback.fit(split)
+        self.train = split.train
+
+    def shared_fit(self):
+        return self.fallback.shared_fit() if hasattr(self.fallback, 'shared_fit') else None
+
+    def score(self, rows):
+        # LSH lookups are per patient; the aggregation is one sparse product for the whole block
+        w_rows, w_cols, w_vals, lonely = [], [], [], []
+        for i, r in enumerate(rows):
+            neighbours, similarity = self.index.neighbours(self.tokens[r].indices, k=self.k_neighbours, exclude_row=r)
+            if len(neighbours) == 0:
+                lonely.append(i)
+            w_rows.extend([i] * len(neighbours))
+            w_cols.extend(neighbours)
+            w_vals.extend(similarity)
+        weights = csr_matrix((w_vals, (w_rows, w_cols)), shape=(len(rows), self.train.shape[0]))
+        scores = unscored_zeros((weights @ self.train).toarray())
+        if lonely:
+            scores[lonely] = self.fallback.score(np.asarray(rows)[lonely])
+        return scores
+
+
+def default_strategies(artifacts):
+    als = ALS()
+    strategies = [Popularity(), ConditionCohort(), CoUsage(), ItemSimilarity(), als, ALSWarm(als),
+                  NearestNeighbours(index=MinHashLSH.from_artifacts(artifacts), fallback=als),
+                  NearestNeighbours(profile=True, fallback=als)]
+    if 'person_gender_concept_id' in artifacts.arrays and artifacts.metadata.get('reference_year'):
+        strategies.insert(2, DemographicCohort(artifacts.arrays['person_gender_concept_id'],
+                                               artifacts.arrays['person_year_of_birth'],
+                                               artifacts.metadata['reference_year']))
+    return strategies
+
+
+def evaluate(strategy, split, k=K, block_size=BLOCK_SIZE):
+    """Fit, score every test patient in blocks, and return quality metrics next to timing."""
+    started = time.perf_counter()
+    strategy.fit(split)
+    fit_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    tops = []
+    for i in range(0, len(split.test_rows), block_size):
+        rows = split.test_rows[i:i + block_size]
+        tops.append(top_k(strategy.score(rows), split.train[rows], k))
+    score_seconds = time.perf_counter() - started
+    top = np.vstack(tops) if tops else np.zeros((0, k), dtype=np.int64)
+
+    # A fit that reused another strategy's training reports that training time too, and says so
+    shared = strategy.shared_fit() if hasattr(strategy, 'shared_fit') else None
+    if shared is not None:
+        fit_seconds += shared[1]
+
+    result = {"strategy": strategy.name, "fit_seconds": round(fit_seconds, 4),
+              "fit_shared_with": shared[0] if shared is not None else None,
+              "patients_per_second": round(len(split.test_rows) / score_seconds, 1) if score_seconds else None}
+    result.update(ranking_metrics(top, split.held_out, split.train.shape[1], k))
+    return result
+
+
+def check_no_signal():
+    """Sanity check of the metrics: patients without conditions get no frequency cohort, so recall must be 0."""
+    drugs = csr_matrix(np.array([[1, 1, 0, 0], [0, 1, 1, 0], [1, 0, 0, 1], [0, 0, 1, 1]], dtype=np.float32))
+    conditions = csr_matrix((4, 3), dtype=np.float32)
+    split = leave_one_out(drugs, conditions, np.random.default_rng(0))
+    result = evaluate(ConditionCohort(), split, k=K)
+    if result[f"recall@{K}"] != 0 or result[f"ndcg@{K}"] != 0 or result["coverage"] != 0:
+        raise AssertionError(f"Strategy without signal scored {result}")
+    return result
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, BigInteger, String, ForeignKey, create_engine
+from sqlalchemy import Column, Integer, BigInteger, String, ForeignKey, DateTime, JSON, create_engine
 from sqlalchemy.orm import declarative_base
 from pydantic import BaseModel
 
@@ -52,6 +52,22 @@ class Concept(Base):
     concept_name = Column(String, nullable=False, index=True)
     domain_id = Column(String, nullable=False, index=True)
 
+# 🔥 Materialized recommendations written by scripts/batch_score.py (one row per patient, served by primary key)
+class RecommendationBatchRun(Base):
+    __tablename__ = 'recommendation_batch_run'
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    model_version = Column(String, nullable=True)
+    started_at = Column(DateTime, nullable=False)
+    finished_at = Column(DateTime, nullable=False)
+    patients_scored = Column(Integer, nullable=False)
+
+class PatientRecommendationCache(Base):
+    __tablename__ = 'patient_recommendation_cache'
+    patient_id = Column(Integer, ForeignKey('patient.id'), primary_key=True)
+    recommendations = Column(JSON, nullable=False)
+    co_usage = Column(JSON, nullable=False)
+    batch_run_id = Column(Integer, ForeignKey('recommendation_batch_run.id'), nullable=False, index=True)
+
 # 🔥 Pydantic models
 class DrugCard(BaseModel):
     drug_concept_id: int
@@ -0,0 +1,171 @@
+# model_registry.py
+# Holds the active ModelArtifacts for the API and hot-swaps it when a new artifact version is published
+# (nightly build_interaction_matrix.py run) or when an admin triggers a reload — no service restart needed.
+# An admin reload of a specific version moves CURRENT to it, so every worker's watcher follows (rollback).
+#
+# Swapping is a single reference assignment: requests read `registry.active` once and keep using that
+# object until they finish, so in-flight requests complete on the old version while new ones see the new one.
+
+import os
+import time
+import threading
+from datetime import datetime, timezone
+import numpy as np
+from artifacts import ARTIFACT_ROOT, current_version, list_versions, load_artifacts, set_current_version
+
+REQUIRED_MATRICES = ('drug', 'condition')
+REQUIRED_ARRAYS = ('person_ids', 'drug_ids', 'condition_ids')
+HISTORY_SIZE = 20
+
+
+def _rss_bytes():
+    # Resident set size of this process (Linux); None where /proc is unavailable
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def validate_artifacts(artifacts):
+    """Raise ValueError if an artifact version is incomplete or internally inconsistent."""
+    missing = [m for m in REQUIRED_MATRICES if m not in artifacts.matrices]
+    missing += [a for a in REQUIRED_ARRAYS if a not in artifacts.arrays]
+    if missing:
+        raise ValueError(f"Artifact {artifacts.version} is missing {missing}")
+
+    n_persons = len(artifacts.person_ids)
+    expected_cols = {'drug': len(artifacts.drug_ids), 'condition': len(artifacts.condition_ids)}
+    for name, n_cols in expected_cols.items():
+        mat = artifacts.matrices[name]
+        if mat.shape != (n_persons, n_cols):
+            raise ValueError(f"{name} matrix shape {mat.shape} does not match id maps ({n_persons}, {n_cols})")
+        indptr, indices = mat.indptr, mat.indices
+        if indptr[0] != 0 or indptr[-1] != len(indices) or np.any(np.diff(indptr) < 0):
+            raise ValueError(f"{name} matrix has a corrupt indptr")
+        if len(indices) and (indices.min() < 0 or indices.max() >= n_cols):
+            raise ValueError(f"{name} matrix has column indices out of range")
+
+    for name in REQUIRED_ARRAYS:
+        ids = artifacts.arrays[name]
+        if len(ids) > 1 and np.any(np.diff(ids) <= 0):
+            raise ValueError(f"{name} must be strictly increasing")
+
+
+class ModelRegistry:
+    def __init__(self, root=ARTIFACT_ROOT, poll_interval=60):
+        self.root = root
+        self.poll_interval = poll_interval
+        self.active = None
+        self.history = []
+        self.last_error = None
+        self._rejected_version = None
+        self._load_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher = None
+
+    @property
+    def active_version(self):
+        active = self.active
+        return active.version if active is not None else None
+
+    def check_version(self, version):
+        """Only published version directories under root can be loaded by name."""
+        if version not in list_versions(self.root):
+            raise ValueError(f"Unknown artifact version {version!r}")
+
+    def load(self, version=None):
+        """Load, validate and atomically activate a version (default: CURRENT). Returns the swap record.
+
+        An explicit version is pinned: once it validates, CURRENT is moved to it.
+        """
+        with self._load_lock:
+            pin = version is not None
+            if pin:
+                self.check_version(version)
+            version = version or current_version(self.root)
+            if version is None:
+                raise FileNotFoundError(f"No artifact version published in {self.root}")
+            if version == self.active_version:
+                if pin and current_version(self.root) != version:
+                    set_current_version(self.root, version)
+                return None
+
+            rss_before = _rss_bytes()
+            started = time.perf_counter()
+            try:
+                artifacts = load_artifacts(os.path.join(self.root, version))
+                validate_artifacts(artifacts)  # also pages the index arrays in before the first request needs them
+            except Exception as e:
+                self.last_error = f"{version}: {e}"
+                self._rejected_version = version
+                print(f"❌ Model version {version} rejected: {e}")
+                raise
+            load_seconds = time.perf_counter() - started
+            rss_after = _rss_bytes()
+            if pin:
+                set_current_version(self.root, version)  # the watchers (this and other workers) now agree
+
+            previous = self.active_version
+            self.active = artifacts  # 🔁 atomic swap; old object lives on until in-flight requests release it
+            self.last_error = None
+            record = {
+                "version": version,
+                "previous_version": previous,
+                "activated_at": datetime.now(timezone.utc).isoformat(),
+                "load_seconds": round(load_seconds, 4),
+                "memory_delta_bytes": rss_after - rss_before if rss_before is not None and rss_after is not None else None,
+                "artifact_bytes": artifacts.nbytes(),
+            }
+            self.history = (self.history + [record])[-HISTORY_SIZE:]
+            print(f"✅ Model version {version} active (was {previous}) | load {load_seconds:.3f}s | "
+                  f"Δrss {record['memory_delta_bytes']}")
+            return record
+
+    def reload_async(self, version=None):
+        """Load in a background thread so the caller (e.g. an admin request) returns immediately."""
+        def _run():
+            try:
+                self.load(version)
+            except Exception:
+                pass  # already recorded in last_error; the previous version stays active
+        thread = threading.Thread(target=_run, name="model-reload", daemon=True)
+        thread.start()
+        return thread
+
+    def check_for_update(self):
+        published = current_version(self.root)
+        # A rejected version is not retried by the watcher; an explicit load()/reload still can
+        if published is not None and published not in (self.active_version, self._rejected_version):
+            return self.load(published)
+        return None
+
+    def _watch(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.check_for_update()
+            except Exception:
+                pass  # keep serving the active version; the error is visible via status()
+
+    def start_watcher(self):
+        if self._watcher is None or not self._watcher.is_alive():
+            self._stop.clear()
+            self._watcher = threading.Thread(target=self._watch, name="model-watcher", daemon=True)
+            self._watcher.start()
+
+    def stop_watcher(self):
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join(timeout=5)
+            self._watcher = None
+
+    def status(self):
+        active = self.active
+        return {
+            "active_version": active.version if active is not None else None,
+            "published_version": current_version(self.root),
+            "available_versions": list_versions(self.root),
+            "shapes": {name: list(m.shape) for name, m in active.matrices.items()} if active is not None else {},
+            "last_error": self.last_error,
+            "history": list(self.history),
+        }
@@ -3,17 +3,37 @@ from model.model import Drug, PatientDrugInteraction, PatientConditionInteractio
 from sqlalchemy import func
 import numpy as np
 from collections import defaultdict
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.preprocessing import StandardScaler
-from sklearn.decomposition import TruncatedSVD
-from sklearn.cluster import KMeans
-from scipy.stats import pearsonr
 from model.model import Patient  
+from als import ALSModel
+from cohort_index import CohortIndex, age_band, gender_concept
+from similarity_index import MinHashLSH
+
+# sklearn is the slowest import in the API; it is only needed by get_related_drugs, so load it on first use
+def _sklearn():
+    from sklearn.metrics.pairwise import cosine_similarity
+    from sklearn.preprocessing import StandardScaler
+    from sklearn.cluster import KMeans
+    return cosine_similarity, StandardScaler, KMeans
+
+
+def warm_up():
+    """Import the heavy ML stack ahead of the first request (called from the API lifespan hook)."""
+    _sklearn()
+
 
 # ---------------------------- COLLABORATIVE FILTERING + CLUSTERING ----------------------------
 # Enhanced recommendation: Clustering + User-based Collaborative Filtering with Hybrid Similarity
 
-def get_related_drugs(session: Session, target_drug_id: int, top_n: int = 2):
+def _drug_user_matrix(session: Session, artifacts=None):
+    # Fast path: drug×patient matrix straight from the memory-mapped CSR artifact (no full-table SQL scan)
+    if artifacts is not None:
+        mat = artifacts.drug_matrix
+        active_rows = np.flatnonzero(np.diff(mat.indptr) > 0)  # patients with at least one exposure
+        drugs = [int(d) for d in artifacts.drug_ids]
+        drug_index = {drug_id: idx for idx, drug_id in enumerate(drugs)}
+        matrix = mat[active_rows].T.toarray().astype(float)
+        return drugs, drug_index, matrix
+
     # 🔍 STEP 1: Build interaction matrix (patients x drugs)
     interactions = session.query(PatientDrugInteraction).all()
     user_drug_matrix = defaultdict(dict)
@@ -31,6 +51,13 @@ def get_related_drugs(session: Session, target_drug_id: int, top_n: int = 2):
         for drug_id, exposure in interactions.items():
             if drug_id in drug_index:
                 matrix[drug_index[drug_id], patient_index[pid]] = exposure
+    return drugs, drug_index, matrix
+
+
+def get_related_drugs(session: Session, target_drug_id: int, top_n: int = 2, artifacts=None):
+    # 🔍 STEP 1-2: drug×patient exposure matrix (from loaded artifacts when available, else from the DB)
+    drugs, drug_index, matrix = _drug_user_matrix(session, artifacts)
+    cosine_similarity, StandardScaler, KMeans = _sklearn()
 
     # 🔍 STEP 3: Standardize data (for Pearson-like normalization)
     scaler = StandardScaler(with_mean=True, with_std=False)
@@ -99,6 +126,19 @@ def get_related_drugs(session: Session, target_drug_id: int, top_n: int = 2):
 
 
 # ---------------------------- PATIENT-SPECIFIC RECOMMENDATION ----------------------------
+# Map condition string to concept_id(s) — works like CountVectorizer → token mapping
+# Ensures only conditions with known usage (interactions) are selected
+def match_condition_ids(session: Session, condition_name: str):
+    rows = (
+        session.query(Condition.condition_concept_id)
+        .join(PatientConditionInteraction, Condition.condition_concept_id == PatientConditionInteraction.condition_concept_id)
+        .filter(Condition.concept_name.ilike(f"%{condition_name}%"))
+        .distinct()
+        .all()
+    )
+    return [row.condition_concept_id for row in rows]
+
+
 # Core Idea: Frequency-based user collaborative filtering
 # Method: Exposure Pattern Mining across similar patient cohorts (based on shared condition codes)
 #     - User-Based Collaborative Filtering (Condition → Similar Users)
@@ -114,16 +154,8 @@ def get_patient_recommendations(session: Session, patient_id: int, top_n: int =
     condition_name = patient.condition.strip()
     print(f"🔍 Matching condition name: '{condition_name}'")
 
-    # 🔍 STEP 2: Map condition string to concept_id(s) — works like CountVectorizer → token mapping
-    # Ensures only conditions with known usage (interactions) are selected
-    valid_condition_ids = (
-        session.query(Condition.condition_concept_id)
-        .join(PatientConditionInteraction, Condition.condition_concept_id == PatientConditionInteraction.condition_concept_id)
-        .filter(Condition.concept_name.ilike(f"%{condition_name}%"))
-        .distinct()
-        .all()
-    )
-    valid_condition_ids = [row.condition_concept_id for row in valid_condition_ids]
+    # 🔍 STEP 2: Map condition string to concept_id(s)
+    valid_condition_ids = match_condition_ids(session, condition_name)
 
     if not valid_condition_ids:
         print("❌ No valid condition IDs found in both Condition and PatientConditionInteraction.")
@@ -181,6 +213,164 @@ def get_patient_recommendations(session: Session, patient_id: int, top_n: int =
 
 
 
+# ---------------------------- PATIENT-SPECIFIC RECOMMENDATION (ALS) ----------------------------
+# Core Idea: Implicit-feedback matrix factorization (see als.py)
+# Method: Fold the patient in from their condition embedding (conditions are side features), then score
+#         every drug with a single dot product against the drug factor matrix.
+#     - Works for cold-start patients; with no matching condition it falls back to the average patient.
+def get_als_recommendations(session: Session, patient_id: int, artifacts, top_n: int = 5):
+    model = ALSModel.from_artifacts(artifacts)
+    if model is None:
+        print("⚠️ No ALS factors in the active model; using frequency-based recommendations.")
+        return get_patient_recommendations(session, patient_id, top_n=top_n)
+
+    patient = session.query(Patient).filter(Patient.id == patient_id).first()
+    if not patient:
+        print("❌ Patient not found.")
+        return []
+    condition_name = (patient.condition or "").strip()
+
+    condition_cols = artifacts.condition_cols(match_condition_ids(session, condition_name)) if condition_name else []
+    condition_cols = [int(c) for c in condition_cols if c >= 0]
+    print(f"👤 Patient ID: {patient_id} | folding in {len(condition_cols)} condition(s) for '{condition_name}'")
+
+    top_cols, scores = model.recommend(condition_cols, top_n=top_n)
+    drug_ids = [int(d) for d in artifacts.drug_ids[top_cols]]
+    names = dict(
+        session.query(Drug.drug_concept_id, Drug.concept_name)
+        .filter(Drug.drug_concept_id.in_(drug_ids))
+        .all()
+    )
+    return [
+        {
+            "drug_concept_id": drug_id,
+            "concept_name": names.get(drug_id, "Unknown Drug"),
+            "condition_name": condition_name,
+            "score": round(float(score), 4)
+        }
+        for drug_id, score in zip(drug_ids, scores)
+    ]
+
+
+# ---------------------------- PATIENT-SPECIFIC RECOMMENDATION (DEMOGRAPHIC COHORT) ----------------------------
+# Core Idea: Frequency-based user collaborative filtering, with neighbours matched on condition + gender + age band
+# Method: Cohort = condition rows tested against precomputed gender / age-band bitsets (cohort_index.py),
+#         then summed exposures of the cohort rows
+#     - If nobody matches all filters, the age band and then the gender filter are relaxed
+#     - Genders outside the OMOP male/female concepts and unknown ages are not filtered on (nor reported)
+def get_demographic_recommendations(session: Session, patient_id: int, artifacts, top_n: int = 5):
+    index = artifacts.derived('cohort_index', CohortIndex.from_artifacts) if artifacts is not None else None
+    if index is None:
+        print("⚠️ No cohort index in the active model; using frequency-based recommendations.")
+        return get_patient_recommendations(session, patient_id, top_n=top_n)
+
+    patient = session.query(Patient).filter(Patient.id == patient_id).first()
+    if not patient or not patient.condition:
+        print("❌ Patient not found or condition is missing.")
+        return []
+    condition_name = patient.condition.strip()
+
+    condition_cols = artifacts.condition_cols(match_condition_ids(session, condition_name))
+    condition_cols = condition_cols[condition_cols >= 0]
+    if len(condition_cols) == 0:
+        print("❌ No valid condition IDs found for this patient.")
+        return []
+
+    # 👥 condition ∧ gender ∧ age band, relaxing demographics until the cohort is non-empty
+    demographics = {}
+    if gender_concept(patient.gender) is not None:
+        demographics['gender'] = gender_concept(patient.gender)
+    if age_band(patient.age) is not None:
+        demographics['age'] = patient.age
+    tiers = [demographics, {k: v for k, v in demographics.items() if k != 'age'}, {}]
+    tiers = [f for i, f in enumerate(tiers) if f not in tiers[:i]]
+    for filters in tiers:
+        matched_on = ", ".join(["condition"] + list(filters))
+        cohort = index.select(condition_cols, **filters)
+        cohort_size = len(cohort)
+        if cohort_size:
+            break
+    print(f"👥 Cohort matched on {matched_on}: {cohort_size} people")
+    if not cohort_size:
+        return []
+
+    # 💊 Summed exposures of the cohort rows, top-N
+    exposures = np.asarray(artifacts.drug_matrix[cohort].sum(axis=0, dtype=np.int64)).ravel()
+    top = np.flatnonzero(exposures > 0)
+    top = top[np.argsort(-exposures[top], kind='stable')][:top_n]
+    drug_ids = [int(d) for d in artifacts.drug_ids[top]]
+    names = dict(
+        session.query(Drug.drug_concept_id, Drug.concept_name)
+        .filter(Drug.drug_concept_id.in_(drug_ids))
+        .all()
+    )
+    return [
+        {
+            "drug_concept_id": drug_id,
+            "concept_name": names.get(drug_id, "Unknown Drug"),
+            "condition_name": condition_name,
+            "exposure_count": int(exposures[col]),
+            "cohort_size": cohort_size,
+            "matched_on": matched_on
+        }
+        for drug_id, col in zip(drug_ids, top)
+    ]
+
+
+# ---------------------------- PATIENT-SPECIFIC RECOMMENDATION (NEAREST NEIGHBOURS) ----------------------------
+# Core Idea: True user-based collaborative filtering — top-k Jaccard neighbours over condition sets
+# Method: MinHash-LSH candidate lookup (similarity_index.py), exact Jaccard re-rank, then similarity-weighted
+#         exposure aggregation over the neighbours
+#     - Patients with several or rare conditions still get a cohort; no exact single-condition match needed
+#     - When no patient shares an LSH bucket (e.g. a broad condition string matching many concepts), falls back to
+#       the ALS fold-in (itself falling back to frequency when the model has no factors)
+def get_lsh_recommendations(session: Session, patient_id: int, artifacts, top_n: int = 5, k_neighbours: int = 50):
+    index = artifacts.derived('lsh_conditions', lambda a: MinHashLSH.from_artifacts(a, 'lsh_conditions')) if artifacts is not None else None
+    if index is None:
+        print("⚠️ No LSH index in the active model; using frequency-based recommendations.")
+        return get_patient_recommendations(session, patient_id, top_n=top_n)
+
+    patient = session.query(Patient).filter(Patient.id == patient_id).first()
+    if not patient or not patient.condition:
+        print("❌ Patient not found or condition is missing.")
+        return []
+    condition_name = patient.condition.strip()
+
+    condition_cols = artifacts.condition_cols(match_condition_ids(session, condition_name))
+    condition_cols = condition_cols[condition_cols >= 0]
+
+    # 👥 Top-k Jaccard neighbours of the patient's condition set
+    rows, similarity = index.neighbours(condition_cols, k=k_neighbours)
+    print(f"👥 Found {len(rows)} neighbour(s) for '{condition_name}'")
+    if len(rows) == 0:
+        print("⚠️ No LSH neighbours; using ALS recommendations.")
+        return get_als_recommendations(session, patient_id, artifacts, top_n=top_n)
+
+    # 💊 Similarity-weighted exposures of the neighbours
+    exposures = artifacts.drug_matrix[rows].astype(np.float64)
+    weighted = np.asarray(exposures.T @ similarity).ravel()
+    totals = np.asarray(exposures.sum(axis=0)).ravel()
+    top = np.flatnonzero(weighted > 0)
+    top = top[np.argsort(-weighted[top], kind='stable')][:top_n]
+    drug_ids = [int(d) for d in artifacts.drug_ids[top]]
+    names = dict(
+        session.query(Drug.drug_concept_id, Drug.concept_name)
+        .filter(Drug.drug_concept_id.in_(drug_ids))
+        .all()
+    )
+    return [
+        {
+            "drug_concept_id": drug_id,
+            "concept_name": names.get(drug_id, "Unknown Drug"),
+            "condition_name": condition_name,
+            "exposure_count": int(totals[col]),
+            "score": round(float(weighted[col]), 4),
+            "neighbours": len(rows)
+        }
+        for drug_id, col in zip(drug_ids, top)
+    ]
+
+
 # ---------------------------- CO-USAGE FROM RECOMMENDED DRUG ----------------------------
 # Co-usage filtering based on the top recommended drug (not self-history)
 # Used to suggest additional drugs that are often co-taken with the most-used recommended drug
@@ -3,13 +3,22 @@
 # by counting exposures/occurrences (similar to count vectorizer concept, but using explicit counts from structured data since the data used are already encoded in numeric figures)
 
 import os
+import sys
 import pandas as pd
 import numpy as np
 from scipy.sparse import csr_matrix
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from artifacts import save_artifacts, prune_versions
+from cohort_index import build_cohort_index
+from similarity_index import build_condition_index
+from datetime import date
+
 # Configuration
 OMOP_DIR     = r"C:\Users\princepaul\Desktop\treatment_recommender_system\backend\data\1_omop_data_csv"
 OUTPUT_DIR   = r"C:\Users\princepaul\Desktop\treatment_recommender_system\backend\data\Ingested_data"
+ARTIFACT_DIR = os.path.join(OUTPUT_DIR, "artifacts")
+KEEP_VERSIONS  = 3   # older artifact versions are pruned after publishing
 MIN_EXPOSURES  = 5   # minimum drug exposures per patient
 MIN_CONDITIONS = 1   # minimum condition occurrences per patient
 
@@ -69,29 +78,44 @@ mat_cond = csr_matrix(
     shape=(len(unique_pids), len(unique_conds))
 )
 
+# Demographics aligned to the matrix rows + compressed cohort bitsets (gender / age band / condition)
+print("Building demographic cohort index…")
+reference_year = date.today().year
+demo = df_person.drop_duplicates('person_id').set_index('person_id').reindex(unique_pids)
+person_gender = demo['gender_concept_id'].fillna(0).to_numpy(dtype=np.int64)
+person_yob    = demo['year_of_birth'].fillna(0).to_numpy(dtype=np.int32)
+cohort_arrays, cohort_meta = build_cohort_index(person_gender, person_yob, mat_cond, reference_year)
+
+# MinHash signatures + LSH band index over each patient's condition set
+print("Building MinHash-LSH patient similarity index…")
+lsh_arrays, lsh_meta = build_condition_index(mat_cond)
+
 # Save all outputs
+# Matrices go out as raw .npy CSR components in a new versioned artifact directory, so the API can
+# open them with mmap_mode='r' (no decompression, one shared page-cache copy across workers)
 print(f"Saving outputs to {OUTPUT_DIR}…")
-np.savez_compressed(
-    os.path.join(OUTPUT_DIR, 'interaction_matrix_drug.npz'),
-    data=mat_drug.data,
-    indices=mat_drug.indices,
-    indptr=mat_drug.indptr,
-    shape=mat_drug.shape
-)
-np.savez_compressed(
-    os.path.join(OUTPUT_DIR, 'interaction_matrix_condition.npz'),
-    data=mat_cond.data,
-    indices=mat_cond.indices,
-    indptr=mat_cond.indptr,
-    shape=mat_cond.shape
+version = save_artifacts(
+    ARTIFACT_DIR,
+    matrices={'drug': mat_drug, 'condition': mat_cond},
+    arrays={
+        'person_ids': unique_pids.astype(np.int64),
+        'drug_ids': unique_drugs.astype(np.int64),
+        'condition_ids': unique_conds.astype(np.int64),
+        'person_gender_concept_id': person_gender,
+        'person_year_of_birth': person_yob,
+        **cohort_arrays,
+        **lsh_arrays,
+    },
+    metadata={'min_exposures': MIN_EXPOSURES, 'min_conditions': MIN_CONDITIONS,
+              'reference_year': reference_year, 'cohort_index': cohort_meta, 'lsh': lsh_meta},
 )
+prune_versions(ARTIFACT_DIR, keep=KEEP_VERSIONS)
 pd.DataFrame({'person_id': unique_pids}).to_csv(os.path.join(OUTPUT_DIR, 'person_index.csv'), index=False)
 pd.DataFrame({'drug_concept_id': unique_drugs}).to_csv(os.path.join(OUTPUT_DIR, 'drug_index.csv'), index=False)
 pd.DataFrame({'condition_concept_id': unique_conds}).to_csv(os.path.join(OUTPUT_DIR, 'condition_index.csv'), index=False)
 
 print("Completed. Check the output directory for:")
-print("  • interaction_matrix_drug.npz")
-print("  • interaction_matrix_condition.npz")
+print(f"  • artifacts/{version}/ (drug & condition CSR matrices, id maps, cohort index, LSH index — now CURRENT)")
 print("  • person_index.csv")
 print("  • drug_index.csv")
 print("  • condition_index.csv")
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+concept_cache.py
+
+One-time conversion of the OMOP CONCEPT.csv vocabulary into a columnar cache of
+memory-mappable NumPy arrays, so ingest scripts stop re-tokenizing the multi-GB TSV.
+
+Reads:
+  - data/concepts/CONCEPT.csv               (the huge vocabulary file, tab separated)
+
+Writes (data/concepts/concept_cache/):
+  - concept_id.npy       int64, rows sorted by (domain_id, concept_id)
+  - vocabulary_code.npy  int16 code into meta.json["vocabularies"]
+  - name_offsets.npy     int64, len(concept_id) + 1 byte offsets into name_bytes
+  - name_chars.npy       int64, len(concept_id) + 1 character offsets of the same names
+  - name_missing.npy     bool, True where CONCEPT.csv had no name (read back as NaN)
+  - name_bytes.npy       uint8, UTF-8 concept names back to back
+  - meta.json            domain -> [start, stop) row ranges, vocabularies, source stamp
+
+Because rows are grouped by domain, a domain filter is a plain slice of the
+memory-mapped arrays (zero copy); names are only decoded for the rows asked for,
+one UTF-8 decode per run of consecutive rows, cut at the character offsets.
+"""
+
+import os
+import json
+import numpy as np
+import pandas as pd
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+CONCEPTS_CSV = os.getenv('CONCEPT_CSV', os.path.join(PROJECT_ROOT, "data", "concepts", "CONCEPT.csv"))
+CACHE_DIR    = os.getenv('CONCEPT_CACHE_DIR', os.path.join(PROJECT_ROOT, "data", "concepts", "concept_cache"))
+CACHE_FORMAT = 2
+
+
+def _source_stamp(csv_path):
+    st = os.stat(csv_path)
+    return {"path": os.path.abspath(csv_path), "size": st.st_size, "mtime": int(st.st_mtime)}
+
+
+def build_concept_cache(csv_path=CONCEPTS_CSV, cache_dir=CACHE_DIR, sep='\t'):
+    """Parse CONCEPT.csv exactly once and write the columnar cache to cache_dir."""
+    print(f"Building concept cache from {csv_path}…")
+    df = pd.read_csv(csv_path, sep=sep,
+                     usecols=['concept_id', 'concept_name', 'domain_id', 'vocabulary_id'],
+                     dtype={'concept_id': np.int64, 'concept_name': str, 'domain_id': str, 'vocabulary_id': str},
+                     low_memory=False)
+    # Missing names stay NaN (NULL in the database) as with a plain read_csv; domain and vocabulary are
+    # NOT NULL in the CDM, blank them only so they can be grouped
+    df[['domain_id', 'vocabulary_id']] = df[['domain_id', 'vocabulary_id']].fillna('')
+    df = df.sort_values(['domain_id', 'concept_id'], kind='stable').reset_index(drop=True)
+
+    # Domain row ranges: rows are contiguous per domain after the sort
+    domain_codes, domains = pd.factorize(df['domain_id'], sort=True)
+    starts = np.searchsorted(domain_codes, np.arange(len(domains)), side='left')
+    stops = np.searchsorted(domain_codes, np.arange(len(domains)), side='right')
+    domain_ranges = {d: [int(a), int(b)] for d, a, b in zip(domains, starts, stops)}
+
+    vocab_codes, vocabularies = pd.factorize(df['vocabulary_id'], sort=True)
+
+    # Names: byte + character offsets into one UTF-8 blob
+    missing = df['concept_name'].isna().to_numpy()
+    names = df['concept_name'].fillna('')
+    encoded = [name.encode('utf-8') for name in names.tolist()]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum(np.fromiter((len(b) for b in encoded), dtype=np.int64, count=len(encoded)), out=offsets[1:])
+    chars = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum(names.str.len().to_numpy(dtype=np.int64), out=chars[1:])
+    blob = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+
+    # Write into a temp dir and swap in, so readers never see a half-written cache
+    tmp_dir = cache_dir + '.tmp'
+    os.makedirs(tmp_dir, exist_ok=True)
+    np.save(os.path.join(tmp_dir, 'concept_id.npy'), df['concept_id'].to_numpy(dtype=np.int64))
+    np.save(os.path.join(tmp_dir, 'vocabulary_code.npy'), vocab_codes.astype(np.int16))
+    np.save(os.path.join(tmp_dir, 'name_offsets.npy'), offsets)
+    np.save(os.path.join(tmp_dir, 'name_chars.npy'), chars)
+    np.save(os.path.join(tmp_dir, 'name_missing.npy'), missing)
+    np.save(os.path.join(tmp_dir, 'name_bytes.npy'), blob)
+    with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+        json.dump({
+            "format": CACHE_FORMAT,
+            "rows": int(len(df)),
+            "domains": domain_ranges,
+            "vocabularies": list(vocabularies),
+            "source": _source_stamp(csv_path),
+        }, f, indent=2)
+
+    if os.path.isdir(cache_dir):
+        old_dir = cache_dir + '.old'
+        os.replace(cache_dir, old_dir)
+        os.replace(tmp_dir, cache_dir)
+        for name in os.listdir(old_dir):
+            os.remove(os.path.join(old_dir, name))
+        os.rmdir(old_dir)
+    else:
+        os.replace(tmp_dir, cache_dir)
+    print(f"✅ Cached {len(df):,} concepts across {len(domains)} domains in {cache_dir}")
+
+
+class ConceptCache:
+    """Read-only, memory-mapped view of the concept cache."""
+
+    def __init__(self, cache_dir=CACHE_DIR):
+        with open(os.path.join(cache_dir, 'meta.json')) as f:
+            self.meta = json.load(f)
+        if self.meta.get("format") != CACHE_FORMAT:
+            raise ValueError(f"Unsupported concept cache format in {cache_dir}: {self.meta.get('format')}")
+        load = lambda name: np.load(os.path.join(cache_dir, name), mmap_mode='r')
+        self.concept_id = load('concept_id.npy')
+        self.vocabulary_code = load('vocabulary_code.npy')
+        self.name_offsets = load('name_offsets.npy')
+        self.name_chars = load('name_chars.npy')
+        self.name_missing = load('name_missing.npy')
+        self.name_bytes = load('name_bytes.npy')
+        self.vocabularies = np.array(self.meta["vocabularies"], dtype=object)
+
+    def __len__(self):
+        return self.meta["rows"]
+
+    @property
+    def domains(self):
+        return list(self.meta["domains"])
+
+    def _range(self, domain_id=None):
+        if domain_id is None:
+            return 0, len(self)
+        start, stop = self.meta["domains"].get(domain_id, (0, 0))
+        return start, stop
+
+    def concept_ids(self, domain_id=None):
+        """Sorted concept ids of a domain — a zero-copy slice of the memory map."""
+        start, stop = self._range(domain_id)
+        return self.concept_id[start:stop]
+
+    def _decode(self, rows):
+        # Each run of consecutive rows is one bytes → str decode, then cut at the stored character offsets
+        rows = np.asarray(rows, dtype=np.int64)
+        names = np.empty(len(rows), dtype=object)
+        if len(rows) == 0:
+            return names
+        run_starts = np.concatenate([[0], np.flatnonzero(np.diff(rows) != 1) + 1, [len(rows)]])
+        for a, b in zip(run_starts[:-1].tolist(), run_starts[1:].tolist()):
+            first, last = rows[a], rows[b - 1] + 1
+            text = bytes(self.name_bytes[self.name_offsets[first]:self.name_offsets[last]]).decode('utf-8')
+            cuts = (self.name_chars[first:last + 1] - self.name_chars[first]).tolist()
+            names[a:b] = [text[i:j] for i, j in zip(cuts[:-1], cuts[1:])]
+        names[self.name_missing[rows]] = np.nan
+        return names
+
+    def names(self, domain_id=None):
+        start, stop = self._range(domain_id)
+        return self._decode(np.arange(start, stop)).tolist()
+
+    def lookup_rows(self, ids, domain_id=None):
+        """Row positions of ids (-1 when absent); binary search within each domain block."""
+        ids = np.asarray(ids, dtype=np.int64)
+        rows = np.full(len(ids), -1, dtype=np.int64)
+        ranges = [self._range(domain_id)] if domain_id else list(self.meta["domains"].values())
+        for start, stop in ranges:
+            block = self.concept_id[start:stop]
+            if len(block) == 0:
+                continue
+            pos = np.searchsorted(block, ids)
+            pos_clipped = np.minimum(pos, len(block) - 1)
+            hit = (pos < len(block)) & (block[pos_clipped] == ids) & (rows < 0)
+            rows[hit] = start + pos_clipped[hit]
+        return rows
+
+    def to_frame(self, domain_id=None, rows=None):
+        """Materialize concept_id, concept_name, domain_id, vocabulary_id for a domain or row set."""
+        if rows is None:
+            start, stop = self._range(domain_id)
+            rows = np.arange(start, stop)
+        rows = np.asarray(rows, dtype=np.int64)
+        domain_col = np.empty(len(rows), dtype=object)
+        for dom, (start, stop) in self.meta["domains"].items():
+            domain_col[(rows >= start) & (rows < stop)] = dom
+        return pd.DataFrame({
+            'concept_id': self.concept_id[rows],
+            'concept_name': self._decode(rows),
+            'domain_id': domain_col,
+            'vocabulary_id': self.vocabularies[self.vocabulary_code[rows]],
+        })
+
+
+def is_stale(csv_path=CONCEPTS_CSV, cache_dir=CACHE_DIR):
+    meta_path = os.path.join(cache_dir, 'meta.json')
+    if not os.path.exists(meta_path):
+        return True
+    if not os.path.exists(csv_path):
+        return False  # cache only, e.g. the raw vocabulary was not shipped to this machine
+    with open(meta_path) as f:
+        meta = json.load(f)
+    src = _source_stamp(csv_path)
+    return meta.get("format") != CACHE_FORMAT or any(meta["source"].get(k) != src[k] for k in ("size", "mtime"))
+
+
+def open_concept_cache(csv_path=CONCEPTS_CSV, cache_dir=CACHE_DIR):
+    """Open the cache, (re)building it first if it is missing or older than CONCEPT.csv."""
+    if is_stale(csv_path, cache_dir):
+        build_concept_cache(csv_path, cache_dir)
+    return ConceptCache(cache_dir)
+
+
+if __name__ == "__main__":
+    build_concept_cache()
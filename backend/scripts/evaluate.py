@@ -0,0 +1,48 @@
+# evaluate.py
+# Offline evaluation of every recommender strategy on the CURRENT artifacts (see evaluation.py):
+# leave-one-out precision@K, recall@K, NDCG@K and coverage next to fit time and patients scored per second.
+# Each run is appended to evaluation_results.jsonl so quality and performance can be tracked over time.
+
+import os
+import sys
+import json
+from datetime import datetime, timezone
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from artifacts import ARTIFACT_ROOT, load_current
+from evaluation import K, leave_one_out, default_strategies, evaluate, check_no_signal
+
+MAX_TEST_PATIENTS = 20_000   # sample of test patients (None = all)
+RANDOM_STATE      = 42
+RESULTS_PATH      = os.path.join(os.path.dirname(ARTIFACT_ROOT), 'evaluation_results.jsonl')
+
+if __name__ == '__main__':
+    artifacts = load_current(ARTIFACT_ROOT)
+    if artifacts is None:
+        sys.exit(f"No published artifacts in {ARTIFACT_ROOT}; run build_interaction_matrix.py first")
+    check_no_signal()  # metrics must not credit strategies for drugs they never scored
+    rng = np.random.default_rng(RANDOM_STATE)
+    split = leave_one_out(artifacts.drug_matrix, artifacts.condition_matrix, rng, max_test=MAX_TEST_PATIENTS)
+    print(f"Artifact {artifacts.version}: {split.train.shape[0]:,} patients, "
+          f"{len(split.test_rows):,} held-out exposures, K={K}\n")
+
+    columns = ["strategy", "fit_seconds", "fit_shared_with", "patients_per_second",
+               f"precision@{K}", f"recall@{K}", f"ndcg@{K}", "coverage"]
+    cell = lambda v: f"{'-':>20}" if v is None else f"{v:>20}" if isinstance(v, str) else f"{v:>20.4f}"
+    print("".join(f"{c:>20}" for c in columns))
+    results = []
+    for strategy in default_strategies(artifacts):
+        result = evaluate(strategy, split, k=K)
+        results.append(result)
+        print("".join(cell(result[c]) for c in columns))
+
+    with open(RESULTS_PATH, 'a') as f:
+        f.write(json.dumps({
+            "evaluated_at": datetime.now(timezone.utc).isoformat(),
+            "artifact_version": artifacts.version,
+            "k": K,
+            "test_patients": int(len(split.test_rows)),
+            "results": results,
+        }) + "\n")
+    print(f"\n✅ Results appended to {RESULTS_PATH}")
@@ -4,64 +4,49 @@ extract_condition_names.py
 
 Reads:
   - data/Ingested_data/condition_index.csv   (just a list of all condition_concept_id used)
-  - data/concepts/CONCEPT.csv                (the huge vocabulary file)
+  - data/concepts/concept_cache/             (columnar cache of CONCEPT.csv, see concept_cache.py;
+                                              built from the huge vocabulary file on first use)
 
 Writes:
   - data/Ingested_data/condition_concept.csv (only those concept_ids + their names)
 """
 
 import os
+import numpy as np
 import pandas as pd
-from csv import Sniffer
+from concept_cache import open_concept_cache
 
 # --- CONFIGURE YOUR PATHS HERE ---
 PROJECT_ROOT    = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
 INDEX_PATH      = os.path.join(PROJECT_ROOT, "data", "Ingested_data", "condition_index.csv")
 VOCAB_PATH      = os.path.join(PROJECT_ROOT, "data", "concepts",       "CONCEPT.csv")
+CACHE_DIR       = os.path.join(PROJECT_ROOT, "data", "concepts",       "concept_cache")
 OUTPUT_PATH     = os.path.join(PROJECT_ROOT, "data", "Ingested_data", "condition_concept.csv")
-CHUNKSIZE       = 500_000
-
-def sniff_delimiter(path, nbytes=5000):
-    with open(path, encoding="utf-8", errors="ignore") as f:
-        sample = f.read(nbytes)
-    return Sniffer().sniff(sample).delimiter
 
 def load_index_ids(path):
-    df = pd.read_csv(path, dtype={"condition_concept_id": str})
-    return set(df["condition_concept_id"].tolist())
-
-def extract_names(vocab_path, delim, target_ids, out_path):
-    first = True
-    total = 0
-    for chunk in pd.read_csv(vocab_path,
-                             sep=delim,
-                             usecols=["concept_id","concept_name","domain_id","vocabulary_id"],
-                             dtype=str,
-                             chunksize=CHUNKSIZE,
-                             low_memory=False):
-        # keep only those IDs present in our index
-        keep = chunk[chunk["concept_id"].isin(target_ids)]
-        if not keep.empty:
-            cols = ["concept_id","concept_name","domain_id","vocabulary_id"]
-            keep.to_csv(out_path,
-                        mode="w" if first else "a",
-                        header=first,
-                        index=False,
-                        columns=cols)
-            total += len(keep)
-            print(f"  → wrote {len(keep):,} rows")
-            first = False
-    return total
+    df = pd.read_csv(path, dtype={"condition_concept_id": np.int64})
+    return np.unique(df["condition_concept_id"].to_numpy())
+
+def extract_names(cache, target_ids, out_path):
+    # binary search the cached, sorted concept ids instead of scanning the vocabulary
+    rows = cache.lookup_rows(target_ids)
+    rows = np.sort(rows[rows >= 0])
+    keep = cache.to_frame(rows=rows)
+    keep.to_csv(out_path,
+                index=False,
+                columns=["concept_id","concept_name","domain_id","vocabulary_id"])
+    print(f"  → wrote {len(keep):,} rows")
+    return len(keep)
 
 if __name__ == "__main__":
     print(f"Loading target condition IDs from {INDEX_PATH}...")
     target_ids = load_index_ids(INDEX_PATH)
     print(f"Found {len(target_ids):,} unique condition IDs.\n")
 
-    print(f"Sniffing delimiter of {VOCAB_PATH}...")
-    delim = sniff_delimiter(VOCAB_PATH)
-    print(f"  Detected delimiter = {repr(delim)}\n")
+    print(f"Opening concept cache {CACHE_DIR}...")
+    cache = open_concept_cache(VOCAB_PATH, CACHE_DIR)
+    print(f"  {len(cache):,} concepts cached\n")
 
     print("Extracting matching concept rows...")
-    n = extract_names(VOCAB_PATH, delim, target_ids, OUTPUT_PATH)
+    n = extract_names(cache, target_ids, OUTPUT_PATH)
     print(f"\nDone — extracted {n:,} condition concepts to {OUTPUT_PATH}")
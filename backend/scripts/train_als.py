@@ -0,0 +1,40 @@
+# train_als.py
+# Trains the implicit-feedback ALS model on the CURRENT interaction artifacts and publishes a new artifact
+# version (same matrices + id maps, plus the factor matrices) — the API's model registry picks it up without
+# a restart. Run after build_interaction_matrix.py in the nightly rebuild.
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from artifacts import ARTIFACT_ROOT, load_current, save_artifacts, prune_versions
+from als import ImplicitALS, ALS_ARRAYS
+
+# Configuration
+FACTORS          = 32
+REGULARIZATION   = 0.1
+ALPHA            = 20.0   # confidence = 1 + ALPHA * count
+CONDITION_WEIGHT = 0.5    # condition occurrences count for half a drug exposure
+ITERATIONS       = 10
+KEEP_VERSIONS    = 3
+
+if __name__ == '__main__':
+    artifacts = load_current(ARTIFACT_ROOT)
+    if artifacts is None:
+        sys.exit(f"No published artifacts in {ARTIFACT_ROOT}; run build_interaction_matrix.py first")
+    print(f"Training ALS on artifact version {artifacts.version} "
+          f"({artifacts.drug_matrix.shape[0]:,} patients, {artifacts.drug_matrix.shape[1]:,} drugs, "
+          f"{artifacts.condition_matrix.shape[1]:,} conditions)…")
+
+    model = ImplicitALS(factors=FACTORS, regularization=REGULARIZATION, alpha=ALPHA,
+                        condition_weight=CONDITION_WEIGHT, iterations=ITERATIONS)
+    model.fit(artifacts.drug_matrix, artifacts.condition_matrix)
+    print(f"  → trained in {model.train_seconds:.2f}s")
+
+    arrays = {name: arr for name, arr in artifacts.arrays.items() if name not in ALS_ARRAYS}
+    arrays.update(model.to_arrays())
+    metadata = dict(artifacts.metadata)
+    metadata['als'] = dict(model.params(), train_seconds=round(model.train_seconds, 3), trained_on=artifacts.version)
+    version = save_artifacts(ARTIFACT_ROOT, artifacts.matrices, arrays, metadata=metadata)
+    prune_versions(ARTIFACT_ROOT, keep=KEEP_VERSIONS)
+    print(f"✅ Published artifact version {version} with ALS factors.")
@@ -0,0 +1,155 @@
+# similarity_index.py
+# MinHash signatures + LSH banding over each patient's set of conditions, built vectorized from the CSR
+# artifacts, for sub-linear top-k Jaccard nearest-neighbour cohorts.
+#
+# One index is stored per artifact version, 'lsh_conditions': condition sets only, since API patients are known
+# by their conditions alone. Indexes over other token sets (e.g. condition ∪ drug profiles in evaluation.py) are
+# built in memory with build_minhash_index.
+#
+# Per index the artifact holds <prefix>_signatures (patients × num_perm), <prefix>_band_keys / _band_rows
+# (bands × patients, sorted by key so a bucket lookup is a binary search) and <prefix>_hash_params.
+
+import numpy as np
+from scipy.sparse import csr_matrix, hstack
+
+MERSENNE_PRIME = (1 << 31) - 1
+EMPTY = np.uint32(MERSENNE_PRIME)     # signature value of an empty set
+NUM_PERM = 64
+BANDS = 32                            # 2 rows per band → candidate threshold ≈ (1/32)^(1/2) ≈ 0.18 Jaccard
+MAX_BLOCK_NNZ = 1 << 18
+
+
+def profile_tokens(condition_matrix, drug_matrix):
+    """Patients × (conditions + drugs) set matrix: token = condition column, or n_conditions + drug column."""
+    return hstack([condition_matrix, drug_matrix], format='csr')
+
+
+def _hash_params(num_perm, seed):
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, MERSENNE_PRIME, num_perm, dtype=np.int64)
+    b = rng.integers(0, MERSENNE_PRIME, num_perm, dtype=np.int64)
+    return np.vstack([a, b])
+
+
+def minhash_signatures(token_matrix, hash_params, max_block_nnz=MAX_BLOCK_NNZ):
+    """(rows × num_perm) uint32 MinHash signatures of each row's set of column indices."""
+    mat = csr_matrix(token_matrix)
+    a, b = hash_params[0][:, None], hash_params[1][:, None]
+    n_rows, num_perm = mat.shape[0], hash_params.shape[1]
+    signatures = np.full((n_rows, num_perm), EMPTY, dtype=np.uint32)
+    indptr = np.asarray(mat.indptr, dtype=np.int64)
+    start = 0
+    while start < n_rows:
+        stop = max(int(np.searchsorted(indptr, indptr[start] + max_block_nnz, side='right')) - 1, start + 1)
+        stop = min(stop, n_rows)
+        lo, hi = indptr[start], indptr[stop]
+        if hi > lo:
+            tokens = np.asarray(mat.indices[lo:hi], dtype=np.int64)
+            hashed = (a * tokens[None, :] + b) % MERSENNE_PRIME          # num_perm × block nnz
+            nonempty = np.flatnonzero(np.diff(indptr[start:stop + 1]) > 0)
+            starts = indptr[start + nonempty] - lo
+            signatures[start + nonempty] = np.minimum.reduceat(hashed, starts, axis=1).T
+        start = stop
+    return signatures
+
+
+def _band_multipliers(rows_per_band, seed):
+    rng = np.random.default_rng(seed + 1)
+    return rng.integers(1, 1 << 62, rows_per_band, dtype=np.int64).astype(np.uint64) | np.uint64(1)
+
+
+def band_keys(signatures, bands, seed):
+    """(bands × rows) uint64 bucket keys — each band's signature slice hashed to one integer (wrapping)."""
+    signatures = np.atleast_2d(signatures)
+    rows_per_band = signatures.shape[1] // bands
+    mult = _band_multipliers(rows_per_band, seed)
+    sig = signatures[:, :bands * rows_per_band].astype(np.uint64).reshape(len(signatures), bands, rows_per_band)
+    return (sig * mult).sum(axis=2, dtype=np.uint64).T
+
+
+def build_minhash_index(token_matrix, prefix, num_perm=NUM_PERM, bands=BANDS, seed=42):
+    """Arrays to store in the artifact version for one index, plus its metadata entry."""
+    params = _hash_params(num_perm, seed)
+    signatures = minhash_signatures(token_matrix, params)
+    keys = band_keys(signatures, bands, seed)
+    order = np.argsort(keys, axis=1, kind='stable')
+    arrays = {
+        f'{prefix}_signatures': signatures,
+        f'{prefix}_band_keys': np.take_along_axis(keys, order, axis=1),
+        f'{prefix}_band_rows': order.astype(np.int32),
+        f'{prefix}_hash_params': params,
+    }
+    return arrays, {'num_perm': num_perm, 'bands': bands, 'seed': seed, 'n_tokens': int(token_matrix.shape[1])}
+
+
+class MinHashLSH:
+    def __init__(self, signatures, sorted_keys, sorted_rows, hash_params, bands, seed, token_matrix=None):
+        self.token_matrix = token_matrix  # when given, candidates are re-ranked by exact Jaccard
+        self.signatures = signatures
+        self.sorted_keys = sorted_keys
+        self.sorted_rows = sorted_rows
+        self.hash_params = hash_params
+        self.bands = bands
+        self.seed = seed
+
+    @classmethod
+    def from_artifacts(cls, artifacts, prefix='lsh_conditions'):
+        info = artifacts.metadata.get('lsh', {}).get(prefix) if artifacts is not None else None
+        if info is None or f'{prefix}_signatures' not in artifacts.arrays:
+            return None
+        return cls.from_arrays(artifacts.arrays, prefix, info, token_matrix=artifacts.condition_matrix)
+
+    @classmethod
+    def from_arrays(cls, arrays, prefix, info, token_matrix=None):
+        return cls(arrays[f'{prefix}_signatures'], arrays[f'{prefix}_band_keys'], arrays[f'{prefix}_band_rows'],
+                   arrays[f'{prefix}_hash_params'], info['bands'], info['seed'], token_matrix=token_matrix)
+
+    def signature(self, tokens):
+        tokens = np.unique(np.asarray(tokens, dtype=np.int64))
+        row = csr_matrix((np.ones(len(tokens)), tokens, [0, len(tokens)]), shape=(1, int(tokens.max()) + 1 if len(tokens) else 1))
+        return minhash_signatures(row, np.asarray(self.hash_params))[0]
+
+    def candidates(self, signature):
+        """Rows sharing at least one LSH bucket with the signature — a binary search per band."""
+        keys = band_keys(signature[None, :], self.bands, self.seed)[:, 0]
+        found = []
+        for band, key in enumerate(keys):
+            band_keys_sorted = self.sorted_keys[band]
+            lo = np.searchsorted(band_keys_sorted, key, side='left')
+            hi = np.searchsorted(band_keys_sorted, key, side='right')
+            if hi > lo:
+                found.append(np.asarray(self.sorted_rows[band, lo:hi]))
+        return np.unique(np.concatenate(found)) if found else np.array([], dtype=np.int64)
+
+    def _exact_jaccard(self, rows, tokens):
+        sub = self.token_matrix[rows]
+        shared = np.concatenate([[0], np.cumsum(np.isin(sub.indices, tokens))])
+        inter = shared[sub.indptr[1:]] - shared[sub.indptr[:-1]]
+        return inter / (np.diff(sub.indptr) + len(tokens) - inter)
+
+    def neighbours(self, tokens, k=50, exclude_row=None):
+        """Top-k (rows, Jaccard) among LSH candidates for a set of tokens (MinHash estimate if no token matrix)."""
+        tokens = np.unique(np.asarray(tokens, dtype=np.int64))
+        if len(tokens) == 0:
+            return np.array([], dtype=np.int64), np.array([])
+        signature = self.signature(tokens)
+        rows = self.candidates(signature)
+        if exclude_row is not None:
+            rows = rows[rows != exclude_row]
+        if len(rows) == 0:
+            return rows, np.array([])
+        if self.token_matrix is not None:
+            similarity = self._exact_jaccard(rows, tokens)
+        else:
+            similarity = (np.asarray(self.signatures[rows]) == signature).mean(axis=1)
+        if len(rows) > k:
+            top = np.argpartition(-similarity, k - 1)[:k]
+            rows, similarity = rows[top], similarity[top]
+        order = np.argsort(-similarity, kind='stable')
+        return rows[order], similarity[order]
+
+
+def build_condition_index(condition_matrix, num_perm=NUM_PERM, bands=BANDS, seed=42):
+    """The condition-set index for an artifact version → (arrays, metadata['lsh'])."""
+    arrays, meta = build_minhash_index(condition_matrix, 'lsh_conditions', num_perm, bands, seed)
+    return arrays, {'lsh_conditions': meta}
@@ -0,0 +1,53 @@
+# singleflight.py
+# In-flight request de-duplication ("single-flight"): concurrent calls with the same key share one execution.
+# The first caller (leader) runs the function; callers arriving while it runs wait for and reuse its result,
+# so a burst of identical /drug_details or /recommendations requests costs one pipeline run, not N.
+# Results are not cached after the leader finishes — the next call runs again.
+
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.executed = 0   # calls that actually ran
+        self.shared = 0     # calls served from another caller's in-flight execution
+
+    def do(self, key, fn, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.executed += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self):
+        with self._lock:
+            return {"executed": self.executed, "shared": self.shared, "in_flight": len(self._calls)}